@@ -0,0 +1,54 @@
+"""
+format_events_for_today の「今日に重なるイベントの抽出」部分。
+
+純粋な整数比較だけのループなので mypyc でそのままネイティブ化できる
+（`cd scripts && mypyc _events_core.py`）。ビルド済みの拡張モジュールがあれば
+import 時にそちらが優先され、無ければこの .py がそのまま使われる。
+"""
+from __future__ import annotations
+
+from bisect import bisect_left
+from operator import itemgetter
+from typing import Tuple
+
+# (start_ts, end_ts, allday_like, fixed, title, loc, url, description)
+EventRecord = Tuple[int, int, bool, bool, str, str, str, str]
+
+_start_of = itemgetter(0)
+
+
+def sort_records(records: list[EventRecord]) -> list[EventRecord]:
+    """開始時刻順に並べ替えて返す（events_overlapping の前提）"""
+    return sorted(records, key=_start_of)
+
+
+def events_overlapping(
+    sorted_records: list[EventRecord], day_start_ts: int, day_end_ts: int
+) -> list[tuple[int, EventRecord]]:
+    """
+    開始時刻順の records から [day_start_ts, day_end_ts) に重なるものを (表示開始 ts, record) で返す。
+    day_end_ts 以降に始まるものは二分探索で丸ごと除外し、残りだけ終了時刻を確認する。
+    表示開始は day_start_ts でクリップ済み。結果も開始時刻順。
+    """
+    hi = bisect_left(sorted_records, day_end_ts, key=_start_of)
+    matched: list[tuple[int, EventRecord]] = []
+    for i in range(hi):
+        rec = sorted_records[i]
+        if rec[1] > day_start_ts:
+            start_ts = rec[0]
+            matched.append((start_ts if start_ts > day_start_ts else day_start_ts, rec))
+    return matched
+
+
+def select_today(
+    records: list[EventRecord], day_start_ts: int, day_end_ts: int
+) -> tuple[list[tuple[int, EventRecord]], int]:
+    """
+    開始時刻順の records から今日に重なるものを抽出する（events_overlapping を参照）。
+    2 つ目の戻り値はゼロ長さ補正済みイベントの総数。
+    """
+    normalized = 0
+    for rec in records:
+        if rec[3]:
+            normalized += 1
+    return events_overlapping(records, day_start_ts, day_end_ts), normalized
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+icalendar を使わずに ICS の生バイトから当日分の VEVENT を抜き出す軽量パーサ。
+
+notify_today.py の build_event_records と同じ records 形式
+(start_ts, end_ts, allday_like, fixed, title, loc, url, description) を返す。
+DTSTART/DTEND は YYYYMMDD[THHMMSS[Z]] を直接 int 変換し、TZID=Asia/Tokyo / 浮動時刻は JST、
+末尾 Z は UTC として JST に換算する。それ以外の TZID は zoneinfo で解決する。
+"""
+from __future__ import annotations
+
+import re
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+
+JST = timezone(timedelta(hours=9), name="JST")
+
+_WANTED = frozenset(("DTSTART", "DTEND", "SUMMARY", "LOCATION", "URL", "DESCRIPTION"))
+_TZID_RE = re.compile(r"TZID=\"?([^\";:]+)")
+_TEXT_ESCAPE_RE = re.compile(r"\\([\\;,nN])")
+_JST_TZIDS = {"Asia/Tokyo", "Japan", "JST"}
+
+
+def _unfold(block: bytes) -> bytes:
+    """RFC5545 の折り返し（改行＋空白/タブ）を外す"""
+    if b"\n " not in block and b"\n\t" not in block:
+        return block
+    return block.replace(b"\r\n ", b"").replace(b"\r\n\t", b"").replace(b"\n ", b"").replace(b"\n\t", b"")
+
+
+def parse_vevents(data: bytes):
+    """
+    ICS の生バイトから VEVENT ごとに最小限のプロパティ dict を返すジェネレータ。
+    キーは DTSTART / DTEND / SUMMARY / LOCATION / URL / DESCRIPTION（値は未エスケープの生文字列）と、
+    パラメータ付きなら "<名前>_PARAMS"（例: DTSTART_PARAMS=";TZID=Asia/Tokyo"）。
+    VEVENT の切り出しは bytes.find、行の分解は partition だけで行う（正規表現・icalendar 不使用）。
+    VALARM 内のプロパティは無視する。
+    """
+    mv = memoryview(data)
+    pos = 0
+    while True:
+        begin = data.find(b"BEGIN:VEVENT", pos)
+        if begin < 0:
+            return
+        end = data.find(b"END:VEVENT", begin)
+        if end < 0:
+            return
+        pos = end + 10
+        block = _unfold(mv[begin + 12:end].tobytes())
+        ev = {}
+        in_alarm = False
+        for raw in block.split(b"\n"):
+            line = raw.decode("utf-8", errors="replace").rstrip("\r")
+            if in_alarm:
+                in_alarm = line != "END:VALARM"
+                continue
+            if line == "BEGIN:VALARM":
+                in_alarm = True
+                continue
+            head, sep, value = line.partition(":")
+            if not sep:
+                continue
+            name, _, params = head.partition(";")
+            name = name.upper()
+            if name in _WANTED and name not in ev:
+                ev[name] = value
+                if params:
+                    ev[name + "_PARAMS"] = ";" + params
+        yield ev
+
+
+def _unescape_text(raw: str) -> str:
+    """RFC5545 TEXT のエスケープ（\\n, \\, \\; \\\\）を戻す"""
+    if "\\" not in raw:
+        return raw
+    return _TEXT_ESCAPE_RE.sub(lambda m: "\n" if m.group(1) in "nN" else m.group(1), raw)
+
+
+def _parse_dt(params: str, value: str):
+    """DTSTART/DTEND の値を (JST datetime, is_date) に変換。解釈できなければ (None, False)"""
+    v = value.strip()
+    try:
+        y, mo, d = int(v[0:4]), int(v[4:6]), int(v[6:8])
+        if len(v) == 8:
+            return datetime(y, mo, d, tzinfo=JST), True
+        dt = datetime(y, mo, d, int(v[9:11]), int(v[11:13]), int(v[13:15] or 0))
+    except ValueError:
+        return None, False
+    if v.endswith("Z"):
+        return dt.replace(tzinfo=timezone.utc).astimezone(JST), False
+    m = _TZID_RE.search(params)
+    if m is None:
+        return dt.replace(tzinfo=JST), False
+    tzid = m.group(1).strip()
+    if tzid in _JST_TZIDS:
+        return dt.replace(tzinfo=JST), False
+    try:
+        return dt.replace(tzinfo=ZoneInfo(tzid)).astimezone(JST), False
+    except Exception:
+        return dt.replace(tzinfo=JST), False
+
+
+def normalize_dict_to_jst(ev: dict):
+    """
+    parse_vevents の dict から (start_jst, end_jst, allday_like, fixed) を返す。
+    notify_today.normalize_event_to_jst と同じ規則（DTEND 無し/逆転は +1時間、終日は +1日）。
+    """
+    if "DTSTART" not in ev:
+        return None, None, False, False
+    s, is_date_start = _parse_dt(ev.get("DTSTART_PARAMS", ""), ev["DTSTART"])
+    if s is None:
+        return None, None, False, False
+    e, is_date_end = _parse_dt(ev.get("DTEND_PARAMS", ""), ev["DTEND"]) if "DTEND" in ev else (None, False)
+    allday_like = is_date_start or is_date_end
+    fixed = False
+    if e is None or e <= s:
+        e = s + (timedelta(days=1) if allday_like else timedelta(hours=1))
+        fixed = True
+    return s, e, allday_like, fixed
+
+
+def parse_ics_for_day(data: bytes, today: date) -> list:
+    """
+    ICS の生バイトから today（JST）の [00:00, 翌00:00) に重なる VEVENT だけを records で返す。
+    時刻の判定を先に行い、SUMMARY などのテキスト復号は該当イベントだけで行う。
+    """
+    day_start = datetime(today.year, today.month, today.day, tzinfo=JST)
+    day_start_ts = int(day_start.timestamp())
+    day_end_ts = day_start_ts + 86400
+
+    records = []
+    for ev in parse_vevents(data):
+        s, e, allday_like, fixed = normalize_dict_to_jst(ev)
+        if s is None:
+            continue
+        start_ts = int(s.timestamp())
+        end_ts = int(e.timestamp())
+        if not (start_ts < day_end_ts and end_ts > day_start_ts):
+            continue
+
+        title = _unescape_text(ev["SUMMARY"]) if "SUMMARY" in ev else "(無題)"
+        loc = _unescape_text(ev.get("LOCATION", "")).strip()
+        url_prop = ev.get("URL", "").strip()
+        desc_raw = _unescape_text(ev.get("DESCRIPTION", ""))
+        records.append((start_ts, end_ts, allday_like, fixed, title, loc, url_prop, desc_raw))
+    return records
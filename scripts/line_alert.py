@@ -5,8 +5,11 @@ import textwrap
 import requests
 
 
+_TRUE_VALUES = frozenset(("1", "true", "yes", "on"))
+
+
 def truthy(val: str) -> bool:
-    return str(val or "").strip().lower() in {"1", "true", "yes", "on"}
+    return bool(val) and val.strip().lower() in _TRUE_VALUES
 
 
 def clip(msg: str, limit: int = 1000) -> str:
@@ -1,113 +1,416 @@
 #!/usr/bin/env python3
+from __future__ import annotations
+
 import os
 import sys
 import argparse
-from datetime import datetime, date, time, timedelta
+from datetime import datetime, date, timedelta, timezone
 from pathlib import Path
 
 import re
+import hashlib
+from operator import itemgetter
+import mmap
+import pickle
 from zoneinfo import ZoneInfo
-import requests
-from icalendar import Calendar
 import time as pytime
-
-
-JST = ZoneInfo("Asia/Tokyo")
+import threading
+import uuid
+from typing import TYPE_CHECKING
+
+from _events_core import select_today, sort_records
+
+# requests / icalendar は import が重いので使う経路に入ってから読み込む
+# （--test は icalendar 不要、--dump は requests 不要、キャッシュヒット時は icalendar 不要）
+if TYPE_CHECKING:
+    from icalendar import Calendar
+
+try:
+    import orjson
+
+    def _dumps(obj) -> bytes:
+        return orjson.dumps(obj)
+except ImportError:  # orjson は任意。無ければ標準 json
+    import json
+
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+
+# Asia/Tokyo は DST が無いので固定オフセットで十分（tz データの遷移表引きを避ける）
+JST = timezone(timedelta(hours=9), name="JST")
+_JST_OFFSET = timedelta(hours=9)
+
+# LINE API への送信はヘッダー＋イベント数ぶん続くので、接続（TLS）を使い回す
+# Content-Type はセッションに固定し、本文は _dumps で自前シリアライズして data= で渡す
+_SESSION = None
+_SESSION_LOCK = threading.Lock()
+
+
+def _line_session():
+    global _SESSION
+    if _SESSION is None:
+        # 事前接続スレッドと同時に来ても 1 つだけ作る
+        with _SESSION_LOCK:
+            if _SESSION is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                # 宛先は api.line.me の 1 ホストだけなのでプールも 1 つで足りる
+                session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+                session.headers.update({"Content-Type": "application/json"})
+                _SESSION = session
+    return _SESSION
+
+
+def _preconnect_line():
+    """requests の import と api.line.me への TCP/TLS 接続を済ませてプールに残す（失敗は無視）"""
+    try:
+        _line_session().head("https://api.line.me/v2/bot/", timeout=5)
+    except Exception:
+        pass
+
+
+_JST_OFFSET_S = 9 * 3600
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def day_start_ts_jst(day: date) -> int:
+    """指定日の 00:00 JST を epoch 秒で返す（整数演算のみ）"""
+    return (day.toordinal() - _EPOCH_ORDINAL) * 86400 - _JST_OFFSET_S
 
 
 def today_jst() -> date:
-    """JSTベースの「今日」の日付を返す"""
-    return datetime.now(JST).date()
+    """JSTベースの「今日」の日付を返す（time.time() の整数切り捨てで求める）"""
+    return date.fromordinal(_EPOCH_ORDINAL + (int(pytime.time()) + _JST_OFFSET_S) // 86400)
+
 
+_DT_DATE_RE = re.compile(rb"^(DTSTART|DTEND)([^:\r\n]*):(\d{8})(T\d{6}Z?)?", re.M)
+_JST_TZIDS = (b"TZID=Asia/Tokyo", b"TZID=Japan", b'TZID="Asia/Tokyo"')
 
-def get_today_range_jst(now: datetime | None = None):
+
+def _is_jst_local(params: bytes, time_part: bytes | None) -> bool:
+    """日付部がそのまま JST の日付として読めるか（DATE 値 / TZID=Asia/Tokyo / 浮動時刻）"""
+    if time_part is not None and time_part.endswith(b"Z"):
+        return False
+    return b"TZID=" not in params or any(t in params for t in _JST_TZIDS)
+
+
+def _vevent_may_overlap(block: bytes, lo2: bytes, lo: bytes, today: bytes, hi: bytes) -> bool:
     """
-    Return (day_start, day_end) for "today" in JST as tz-aware datetimes.
-    day_start is today 00:00 JST, day_end is tomorrow 00:00 JST.
+    VEVENT の生バイトから DTSTART/DTEND の日付部だけを見て today と重なり得るか判定する。
+    JST でそのまま読める値は today ちょうどで、UTC や他の TZID は today±1 日まで広げて比較。
+    lo2/lo/hi は today の -2/-1/+1 日（YYYYMMDD）。
+    RRULE は展開しない（normalize_event_to_jst も DTSTART/DTEND しか見ない）ので同じ判定でよい。
     """
-    if now is None:
-        now = datetime.now(JST)
-    else:
-        if now.tzinfo is None:
-            now = now.replace(tzinfo=JST)
+    start = end = None
+    for m in _DT_DATE_RE.finditer(block):
+        bound = today if _is_jst_local(m.group(2), m.group(4)) else None
+        if m.group(1) == b"DTSTART":
+            # 3 つ目は補正（最大 +1日）で today に届き得る最も早い開始日
+            start = (m.group(3), bound or hi, lo if bound else lo2)
         else:
-            now = now.astimezone(JST)
-    day_start = datetime(now.year, now.month, now.day, 0, 0, tzinfo=JST)
-    day_end = day_start + timedelta(days=1)
-    return day_start, day_end
-
-
+            end = (m.group(3), bound or lo)
+        if start is not None and end is not None:
+            # 両方そろえば後ろの長い DESCRIPTION などは走査しない
+            break
+    if start is None:
+        # 判定できないものは残して icalendar 側に任せる
+        return True
+    if start[0] > start[1]:
+        return False
+    if end is None:
+        # DTEND 無しは開始 +1時間（終日は +1日）に補正されるので開始日だけで判定
+        return b"\nDURATION" in block or start[0] >= start[2]
+    if end[0] >= end[1]:
+        return True
+    # DTEND は today より前。逆転/ゼロ長さの補正で開始から延びる場合だけ届き得る。
+    # 同じ日付内の逆転・同時刻や、JST と UTC/他 TZID が混在した値は日付部だけでは
+    # 前後を見分けられないので、補正される側に倒して開始日で判定する
+    if end[0] <= start[0] or (end[1] == today) != (start[1] == today):
+        return start[0] >= start[2]
+    return False
+
+
+_TZID_LINE_RE = re.compile(rb"^TZID:([^\r\n]+)", re.M)
+
+
+def _keep_vtimezone(block: bytes) -> bool:
+    """
+    zoneinfo が知っている TZID なら icalendar が自力で解決できるので VTIMEZONE は不要
+    （STANDARD/DAYLIGHT の展開コストを省く）。未知の TZID の定義だけ残す。
+    """
+    tzid = _TZID_LINE_RE.search(block)
+    if tzid is None:
+        return True
+    try:
+        ZoneInfo(tzid.group(1).decode("utf-8").strip())
+    except Exception:
+        return True
+    return False
+
+
+def _find_line(buf, marker: bytes, start: int) -> int:
+    """行頭にある marker の位置を返す（無ければ -1）"""
+    if start == 0 and buf[: len(marker)] == marker:
+        return 0
+    i = buf.find(b"\n" + marker, max(start - 1, 0))
+    return -1 if i < 0 else i + 1
+
+
+def _line_end(buf, pos: int) -> int:
+    i = buf.find(b"\n", pos)
+    return len(buf) if i < 0 else i + 1
+
+
+def iter_ics_blocks(buf):
+    """
+    ICS のバッファ（bytes または mmap）を bytes.find だけで走査し、VCALENDAR 直下の
+    コンポーネントを (name, block_bytes) で返す。VCALENDAR 自体の行やヘッダー行は (None, chunk)。
+    mmap を渡せばファイル全体を Python の bytes として読み込まずに済む。
+    """
+    n = len(buf)
+    pos = 0
+    while pos < n:
+        begin = _find_line(buf, b"BEGIN:", pos)
+        if begin < 0:
+            yield None, buf[pos:]
+            return
+        head_end = _line_end(buf, begin)
+        name = buf[begin + 6:head_end].strip()
+        if name == b"VCALENDAR":
+            yield None, buf[pos:head_end]
+            pos = head_end
+            continue
+        if begin > pos:
+            yield None, buf[pos:begin]
+        end = _find_line(buf, b"END:" + name, head_end)
+        if end < 0:
+            # END が欠けた末尾のコンポーネントもそのまま渡す
+            yield name, buf[begin:]
+            return
+        pos = _line_end(buf, end)
+        yield name, buf[begin:pos]
+
+
+def filter_ics_blocks(blocks, today: date) -> tuple[bytes, int]:
+    """
+    iter_ics_blocks の結果から today（JST）と重なり得ない VEVENT を落として ICS に組み直す。
+    VTODO/VJOURNAL/VFREEBUSY と zoneinfo で解決できる VTIMEZONE も落とす。
+    UTC / 他 TZID の値だけ日付ずれを見越して判定窓を today±1 日に広げる。
+    戻り値は (組み直した ICS, 間引く前の VEVENT 総数)。
+    """
+    lo2 = (today - timedelta(days=2)).strftime("%Y%m%d").encode()
+    lo = (today - timedelta(days=1)).strftime("%Y%m%d").encode()
+    today_b = today.strftime("%Y%m%d").encode()
+    hi = (today + timedelta(days=1)).strftime("%Y%m%d").encode()
+    out = []
+    vevent_total = 0
+    for name, chunk in blocks:
+        if name is None:
+            out.append(chunk)
+        elif name == b"VEVENT":
+            vevent_total += 1
+            if _vevent_may_overlap(chunk, lo2, lo, today_b, hi):
+                out.append(chunk)
+        elif name == b"VTIMEZONE":
+            if _keep_vtimezone(chunk):
+                out.append(chunk)
+    return b"".join(out), vevent_total
+
+
 def load_calendar(ics_path: Path) -> Calendar:
+    """ICS 全体を読み込んで Calendar を返す（--dump 用。間引きはしない）"""
+    from icalendar import Calendar
+
     if not ics_path.exists():
         print(f"ICSが見つかりません: {ics_path}", file=sys.stderr)
         sys.exit(1)
-    data = ics_path.read_bytes()
-    return Calendar.from_ical(data)
-
-
-# (旧ロジック to_tz/event_time_range_jst/normalize_event は ZoneInfo/JSTベースの as_jst_range へ統合)
+    return Calendar.from_ical(ics_path.read_bytes())
+
+
+def load_calendar_for_day(ics_path: Path, today: date) -> tuple[Calendar, int]:
+    """
+    ICS を mmap して VEVENT 単位で走査し、today と重なり得ない VEVENT をパース前に間引いた
+    Calendar と、間引く前の VEVENT 総数を返す。
+    """
+    from icalendar import Calendar
+
+    if ics_path.stat().st_size == 0:
+        return Calendar.from_ical(b""), 0
+    with ics_path.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        data, vevent_total = filter_ics_blocks(iter_ics_blocks(buf), today)
+    return Calendar.from_ical(data), vevent_total
+
+
+def calendar_vevents(cal: Calendar) -> list:
+    """VCALENDAR 直下の VEVENT だけを一度で取り出す（walk の再帰走査を避ける）"""
+    return [c for c in cal.subcomponents if c.name == "VEVENT"]
+
+
+def build_event_records(cal: Calendar, today: date | None = None) -> list:
+    """
+    VEVENT を整形に必要な値だけのタプルへ落とす。
+    (start_ts, end_ts, allday_like, fixed, title, loc, url, description)
+    start_ts/end_ts は JST 換算後の epoch 秒（int）。DTSTART の無いイベントは除外。開始時刻順で返す。
+    today を渡すと、その日に重ならないイベントは loc/url/description の文字列化を省いて "" にする。
+    """
+    if today is None:
+        day_start_ts, day_end_ts = None, None
+    else:
+        day_start_ts = day_start_ts_jst(today)
+        day_end_ts = day_start_ts + 86400
+    records = []
+    for vevent in calendar_vevents(cal):
+        s, e, allday_like, fixed = normalize_event_to_jst(vevent)
+        if s is None or e is None:
+            continue
+        start_ts = int(s.timestamp())
+        end_ts = int(e.timestamp())
+        summary = vevent.get("summary")
+        title = str(summary) if summary is not None else "(無題)"
+        if day_start_ts is not None and not (start_ts < day_end_ts and end_ts > day_start_ts):
+            # 表示されないので vText の unescape / str 化はしない
+            records.append((start_ts, end_ts, allday_like, fixed, title, "", "", ""))
+            continue
+        location = vevent.get("location")
+        loc = str(location).strip() if location else ""
+        url_prop = str(vevent.get("url") or "").strip()
+        desc_raw = str(vevent.get("description") or "")
+        records.append((start_ts, end_ts, allday_like, fixed, title, loc, url_prop, desc_raw))
+    return sort_records(records)
+
+
+# records の形や並び順を変えたら上げる（古いキャッシュを読まないように）
+_RECORDS_CACHE_VERSION = 4
+
+
+def _records_cache_key(ics_path: Path, today: date):
+    st = ics_path.stat()
+    with ics_path.open("rb") as f:
+        head = hashlib.blake2b(f.read(4096), digest_size=16).hexdigest()
+    # prefilter 済みの内容を保存するので today もキーに含める
+    return (_RECORDS_CACHE_VERSION, st.st_mtime_ns, st.st_size, head, today.isoformat())
+
+
+def load_event_records(ics_path: Path, today: date) -> tuple[list, int]:
+    """
+    今日分の候補イベントを (records, ICS 内の VEVENT 総数) で返す。
+    <ICS>.cache に (mtime_ns, size, blake2b(先頭4KB), today) をキーにした pickle を置き、
+    ICS が変わっていなければ icalendar のパースを丸ごと省く。キャッシュの読み書き失敗は無視。
+    FAST_ICS=true なら icalendar の代わりに fast_ics の軽量パーサを使う。
+    """
+    if not ics_path.exists():
+        print(f"ICSが見つかりません: {ics_path}", file=sys.stderr)
+        sys.exit(1)
+    cache_path = ics_path.with_name(ics_path.name + ".cache")
+    key = _records_cache_key(ics_path, today)
+    try:
+        with cache_path.open("rb") as f:
+            cached = pickle.load(f)
+        if cached.get("key") == key:
+            return cached["records"], cached["events_total"]
+    except Exception:
+        pass
+
+    if get_env_bool("FAST_ICS", False):
+        from fast_ics import parse_ics_for_day
+
+        data = ics_path.read_bytes()
+        records = sort_records(parse_ics_for_day(data, today))
+        events_total = data.count(b"BEGIN:VEVENT")
+    else:
+        cal, events_total = load_calendar_for_day(ics_path, today)
+        records = build_event_records(cal, today)
+    try:
+        tmp = cache_path.with_name(cache_path.name + f".{os.getpid()}.tmp")
+        with tmp.open("wb") as f:
+            pickle.dump({"key": key, "records": records, "events_total": events_total}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, cache_path)
+    except Exception as e:
+        print(f"[warn] ICSキャッシュを書き込めませんでした: {e}", file=sys.stderr)
+    return records, events_total
+
+
+_TRUE_VALUES = frozenset(("1", "true", "yes", "on"))
 
 
 def get_env_bool(name: str, default: bool) -> bool:
     val = os.getenv(name)
     if val is None:
         return default
-    return str(val).strip().lower() in {"1", "true", "yes", "on"}
+    return bool(val) and val.strip().lower() in _TRUE_VALUES
 
 
-def extract_meeting_link(text: str, url_prop: str = "") -> str:
-    patterns = [
-        r"https?://[\w.-]*zoom\.us/\S+",
-        r"https?://meet\.google\.com/\S+",
-        r"https?://teams\.microsoft\.com/\S+",
-        r"https?://\w+\.webex\.com/\S+",
-        r"https?://webex\.com/\S+",
-    ]
-    corpus = "\n".join(filter(None, [url_prop or "", text or ""]))
-    for pat in patterns:
-        m = re.search(pat, corpus)
-        if m:
-            return m.group(0)
-    m = re.search(r"https?://[^\s)]+", corpus)
-    return m.group(0) if m else ""
+def _parse_int_env(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)) or default)
+    except Exception:
+        return default
 
 
-def clean_description(desc: str, max_len: int) -> str:
-    if not desc:
-        return ""
-    lines = [re.sub(r"\s{2,}", " ", ln.strip()) for ln in desc.splitlines()]
-    s = "\n".join(lines).strip()
-    if max_len > 0 and len(s) > max_len:
-        return s[:max_len] + "…（続きあり）"
-    return s
+# Zoom / Meet / Teams / Webex を 1 本の選択パターンで 1 回だけ走査する
+_MEETING_RE = re.compile(
+    r"https?://(?:[\w.-]*zoom\.us|meet\.google\.com|teams\.microsoft\.com|\w+\.webex\.com|webex\.com)/\S+"
+)
+_ANY_URL_RE = re.compile(r"https?://[^\s)]+")
+# str.splitlines が改行とみなす文字は除いた空白の連続
+_WS_RE = re.compile(r"\s")
+_INLINE_WS_RE = re.compile(r"[^\S\n\r\x0b\x0c\x1c-\x1e\x85\u2028\u2029]{2,}")
+_ALLDAY_TIME_LABEL_RE = re.compile(r"^【開催時刻】\s*終日\s*$")
+
+
+def link_scan_head(desc: str, limit: int) -> str:
+    """
+    リンク走査用に説明文の先頭 limit 文字を返す（0 以下なら全文）。
+    URL の途中で切ると壊れたリンクを拾うので、切れ目は limit 以降の最初の空白まで延ばす。
+    """
+    if limit <= 0 or len(desc) <= limit:
+        return desc
+    m = _WS_RE.search(desc, limit)
+    return desc[: m.start()] if m else desc
+
+
+def extract_meeting_link(text: str, url_prop: str = "") -> str:
+    # URL プロパティが会議リンクならそれで確定（本文は走査しない）
+    m = url_prop and _MEETING_RE.search(url_prop)
+    if m:
+        return m.group(0)
+    m = text and _MEETING_RE.search(text)
+    if m:
+        return m.group(0)
+    m = (url_prop and _ANY_URL_RE.search(url_prop)) or (text and _ANY_URL_RE.search(text))
+    return m.group(0) if m else ""
 
 
 def shape_memo(desc: str, max_len: int, allday_like: bool) -> str:
     if not desc:
         return ""
-    raw_lines = [re.sub(r"\s{2,}", " ", ln.strip()) for ln in desc.splitlines()]
+    # 行内の連続空白は文字列全体に一度だけ sub（改行は対象外）してから行に分ける
+    lines = [ln.strip() for ln in _INLINE_WS_RE.sub(" ", desc).splitlines()]
     shaped = []
+    append = shaped.append
     prev_was_time_label = False
     blank_count = 0
-    for idx, ln in enumerate(raw_lines):
+    for idx, ln in enumerate(lines):
+        if not ln:
+            # collapse multiple blank lines
+            blank_count += 1
+            if blank_count == 1:
+                append(ln)
+            prev_was_time_label = False
+            continue
         # remove "【開催時刻】終日" near the beginning for all-day events
-        if allday_like and idx < 3 and re.match(r"^【開催時刻】\s*終日\s*$", ln):
+        if allday_like and idx < 3 and _ALLDAY_TIME_LABEL_RE.match(ln):
             continue
         # collapse consecutive lines starting with 【開催時刻】
         is_time_label = ln.startswith("【開催時刻】")
         if is_time_label and prev_was_time_label:
             continue
         prev_was_time_label = is_time_label
-
-        # collapse multiple blank lines
-        if ln == "":
-            blank_count += 1
-            if blank_count > 1:
-                continue
-        else:
-            blank_count = 0
-
-        shaped.append(ln)
+        blank_count = 0
+        append(ln)
 
     s = "\n".join(shaped).strip()
     if max_len > 0 and len(s) > max_len:
@@ -115,6 +418,42 @@ def shape_memo(desc: str, max_len: int, allday_like: bool) -> str:
     return s
 
 
+def _to_jst(dt: datetime) -> datetime:
+    """
+    datetime を JST に揃える。浮動時刻は JST とみなす。
+    TZID=Asia/Tokyo など既に +09:00 のものは astimezone の換算をせず tzinfo だけ差し替える。
+    """
+    tz = dt.tzinfo
+    if tz is JST:
+        return dt
+    if tz is None:
+        return dt.replace(tzinfo=JST)
+    if dt.utcoffset() == _JST_OFFSET:
+        return dt.replace(tzinfo=JST)
+    return dt.astimezone(JST)
+
+
+_JST_MIDNIGHTS: dict = {}
+
+
+def _jst_midnight(d: date) -> datetime:
+    """date の 00:00 JST。毎日の終日予定などで同じ日付が繰り返し来るので使い回す"""
+    key = d.toordinal()
+    dt = _JST_MIDNIGHTS.get(key)
+    if dt is None:
+        dt = _JST_MIDNIGHTS[key] = datetime(d.year, d.month, d.day, tzinfo=JST)
+    return dt
+
+
+def _dt_type_slow(value):
+    """datetime/date のサブクラスを基底型に寄せる（datetime は date のサブクラスなので先に判定）"""
+    if isinstance(value, datetime):
+        return datetime
+    if isinstance(value, date):
+        return date
+    return None
+
+
 def normalize_event_to_jst(vevent):
     """
     Normalize VEVENT's DTSTART/DTEND into JST datetimes.
@@ -132,24 +471,30 @@ def normalize_event_to_jst(vevent):
     dtend_prop = vevent.get("dtend")
     dtend = dtend_prop.dt if dtend_prop is not None else None
 
-    is_date_start = isinstance(dtstart, date) and not isinstance(dtstart, datetime)
-    is_date_end = isinstance(dtend, date) and not isinstance(dtend, datetime) if dtend is not None else False
-    allday_like = is_date_start or is_date_end
-
-    def to_jst(dt_obj):
-        if isinstance(dt_obj, datetime):
-            if dt_obj.tzinfo is None:
-                return dt_obj.replace(tzinfo=JST)
-            return dt_obj.astimezone(JST)
-        elif isinstance(dt_obj, date):
-            return datetime(dt_obj.year, dt_obj.month, dt_obj.day, 0, 0, tzinfo=JST)
-        else:
-            return None
+    # icalendar は素の datetime/date を返すので type の同一性で振り分ける
+    t = type(dtstart)
+    if t is not datetime and t is not date:
+        t = _dt_type_slow(dtstart)
+    if t is datetime:
+        is_date_start = False
+        s = _to_jst(dtstart)
+    elif t is date:
+        is_date_start = True
+        s = _jst_midnight(dtstart)
+    else:
+        return None, None, False, False
 
-    s = to_jst(dtstart)
-    e = to_jst(dtend) if dtend is not None else None
-    if s is None:
-        return None, None, allday_like, False
+    e = None
+    is_date_end = False
+    t = type(dtend)
+    if t is not datetime and t is not date:
+        t = _dt_type_slow(dtend)
+    if t is datetime:
+        e = _to_jst(dtend)
+    elif t is date:
+        is_date_end = True
+        e = _jst_midnight(dtend)
+    allday_like = is_date_start or is_date_end
 
     fixed = False
     if e is None or e <= s:
@@ -158,146 +503,170 @@ def normalize_event_to_jst(vevent):
     return s, e, allday_like, fixed
 
 
-def overlaps_today_jst(start: datetime, end: datetime, day_start: datetime, day_end: datetime) -> bool:
-    """Return True if [start, end) and [day_start, day_end) overlap in JST."""
-    return start < day_end and end > day_start
-
-
-# 旧 overlaps/clipped は使用しない（JSTヘルパーへ統合）
-
-
-def format_events_for_today(cal: Calendar, today_jst: date):
-    weekdays_jp = ["月", "火", "水", "木", "金", "土", "日"]
-    header_plain = f"本日の予定 {today_jst.strftime('%Y-%m-%d')}（{weekdays_jp[today_jst.weekday()]}）"
-    label = os.getenv("CAL_LABEL", "").strip()
-    prefix = f"{label}｜" if label else ""
+# 重なり判定 [start, end) ∩ [day_start, day_end) は呼び出し側でインライン化（イベント毎の関数呼び出しを避ける）
 
-    items = []
-    previews = []
-    total = 0
-    normalized_count = 0
-    day_start, day_end = get_today_range_jst()
-    for vevent in cal.walk("vevent"):
-        total += 1
-        s, e, allday_like, fixed = normalize_event_to_jst(vevent)
-        if s is None or e is None:
-            continue
-        if fixed:
-            normalized_count += 1
-        if not overlaps_today_jst(s, e, day_start, day_end):
-            continue
 
-        # 表示時間は今日の範囲でクリップ
-        disp_start = s if s >= day_start else day_start
-        disp_end = e if e <= day_end else day_end
+_WEEKDAYS_JP = ("月", "火", "水", "木", "金", "土", "日")
 
-        summary = vevent.get("summary")
-        title = str(summary) if summary is not None else "(無題)"
-
-        location = vevent.get("location")
-        loc = str(location).strip() if location else ""
-
-        url_prop = str(vevent.get("url") or "").strip()
-        desc_raw = str(vevent.get("description") or "")
+# items (disp_ts, title, line, when) の並べ替えキー。呼び出しごとに作らずモジュールで 1 つ持つ
+_BY_START_TITLE = itemgetter(0, 1)
 
-        show_memo = get_env_bool("SHOW_MEMO", True)
-        show_links = get_env_bool("SHOW_LINKS", True)
-        try:
-            memo_max = int(os.getenv("MEMO_MAX", "180") or 180)
-        except Exception:
-            memo_max = 180
+
+def format_events_for_today(records: list, today_jst: date, events_total: int | None = None):
+    """
+    records（build_event_records の形式）から今日 JST に重なるものを整形する。
+    比較は epoch 秒の整数同士で行い、datetime に戻すのは該当イベントの表示時だけ。
+    events_total は間引く前の ICS 全体の VEVENT 数（省略時は records の件数）。
+    """
+    today_str = f"{today_jst.year:04d}-{today_jst.month:02d}-{today_jst.day:02d}"
+    header_plain = f"本日の予定 {today_str}（{_WEEKDAYS_JP[today_jst.weekday()]}）"
+    label = os.getenv("CAL_LABEL", "").strip()
+    prefix = f"{label}｜" if label else ""
+
+    items = []
+    candidates = len(records)
+    total = candidates if events_total is None else events_total
+    # JST は固定オフセットなので 1 日は常に 86400 秒
+    day_start_ts = day_start_ts_jst(today_jst)
+    day_end_ts = day_start_ts + 86400
+    # 重なり判定とクリップは _events_core（mypyc でビルドされていればネイティブ版）
+    todays, normalized_count = select_today(records, day_start_ts, day_end_ts)
+    # 表示トグルはループ外で一度だけ読む
+    show_memo = get_env_bool("SHOW_MEMO", True)
+    show_links = get_env_bool("SHOW_LINKS", True)
+    memo_max = _parse_int_env("MEMO_MAX", 180)
+    # 会議リンクは説明の冒頭にあるので走査は先頭だけ（0 以下で全文）
+    link_scan_max = _parse_int_env("LINK_SCAN_MAX", 1024)
+    for disp_ts, (_, _, allday_like, _, title, loc, url_prop, desc_raw) in todays:
+        # 表示時間は今日 0:00 からの経過秒で持つ
+        disp_sec = disp_ts - day_start_ts
 
         memo = shape_memo(desc_raw, memo_max, allday_like) if show_memo else ""
-        link = extract_meeting_link("\n".join([desc_raw, loc]), url_prop) if show_links else ""
+        if show_links:
+            link = extract_meeting_link(f"{link_scan_head(desc_raw, link_scan_max)}\n{loc}", url_prop)
+        else:
+            link = ""
 
-        when = "終日" if allday_like else f"{disp_start.strftime('%H:%M')}"
+        # strftime は毎回書式を解釈するので HH:MM は経過秒から直接組み立てる
+        when = "終日" if allday_like else f"{disp_sec // 3600:02d}:{disp_sec % 3600 // 60:02d}"
 
         # New format: bullet, title, optional link, memo only (no auto labels)
-        lines = [f"・{when}", f"{title}"]
-        if get_env_bool("SHOW_LINKS", True) and link:
-            lines.append(f"リンク：{link}")
-        if get_env_bool("SHOW_MEMO", True) and memo:
-            lines.append("メモ：")
-            lines.append(memo)
-        line_joined = "\n".join(lines)
+        # 中間リストを作らず f-string で組み立てる（リンクもメモも無ければ 1 つの f-string だけ）
+        line_joined = f"・{when}\n{title}"
+        if link:
+            line_joined = f"{line_joined}\nリンク：{link}"
+        if memo:
+            line_joined = f"{line_joined}\nメモ：\n{memo}"
 
         # 1 VEVENT = 1件。重複排除は行わず、そのまま蓄積。
-        items.append((disp_start, title, line_joined))
-        token = "終日" if allday_like else disp_start.strftime('%H:%M')
-        previews.append(f"{token}:{title}")
+        # プレビューもソート後の items から作るので when も一緒に持つ
+        items.append((disp_ts, title, line_joined, when))
 
     matched = len(items)
     # デバッグ出力（必ず1行出す）
-    print(f"デバッグ: today={today_jst.strftime('%Y-%m-%d')}, events_total={total}, normalized={normalized_count}, matched={matched}")
+    # events_total は ICS 全体の VEVENT 数。candidates / normalized_candidates は間引き後に残った候補だけの件数
+    print(f"デバッグ: today={today_str}, events_total={total}, candidates={candidates}, normalized_candidates={normalized_count}, matched={matched}")
 
     if not items:
         header_msg = f"【{prefix}{header_plain} 全0件】"
         return header_msg, []
 
     # 開始時刻→タイトルでソート（同時刻の並びが安定するように）
-    items.sort(key=lambda x: (x[0], x[1]))
-    # プレビュー（先頭3件）
-    preview = " / ".join(previews[:3])
+    items.sort(key=_BY_START_TITLE)
+    # プレビュー（ソート後の先頭3件）
+    preview = " / ".join(f"{when}:{title}" for _, title, _, when in items[:3])
     if preview:
         print(f"抽出プレビュー: {preview}")
-    body = "\n".join(line for _, _, line in items)
     header_msg = f"【{prefix}{header_plain} 全{matched}件】"
-    event_msgs = [line for _, _, line in items]
+    event_msgs = [line for _, _, line, _ in items]
     return header_msg, event_msgs
-
-
-def send_push(message: str):
+
+
+# LINE Messaging API の push/broadcast は 1 リクエストで最大 5 メッセージまで
+LINE_MAX_MESSAGES = 5
+
+
+def send_push(messages: list, retry_key: str | None = None):
     access_token = os.getenv("LINE_CHANNEL_ACCESS_TOKEN")
     to = os.getenv("LINE_TO")
     if not access_token or not to:
-        print("[DRY RUN] PUSH: 必要な環境変数が未設定のため送信スキップ\n---\n" + message)
+        print("[DRY RUN] PUSH: 必要な環境変数が未設定のため送信スキップ\n---\n" + "\n---\n".join(messages))
         return 0, True, "dry-run"
     url = "https://api.line.me/v2/bot/message/push"
-    headers = {"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"}
-    payload = {"to": to, "messages": [{"type": "text", "text": message}]}
-    resp = requests.post(url, headers=headers, json=payload, timeout=15)
+    headers = {"Authorization": f"Bearer {access_token}"}
+    if retry_key:
+        headers["X-Line-Retry-Key"] = retry_key
+    payload = {"to": to, "messages": [{"type": "text", "text": m} for m in messages]}
+    resp = _line_session().post(url, headers=headers, data=_dumps(payload), timeout=15)
     ok = 200 <= resp.status_code < 300
     return resp.status_code, ok, (resp.text[:500] if resp.text else "")
 
 
-def send_broadcast(message: str):
+def send_broadcast(messages: list, retry_key: str | None = None):
     access_token = os.getenv("LINE_CHANNEL_ACCESS_TOKEN")
     if not access_token:
-        print("[DRY RUN] BROADCAST: 環境変数が未設定のため送信スキップ\n---\n" + message)
+        print("[DRY RUN] BROADCAST: 環境変数が未設定のため送信スキップ\n---\n" + "\n---\n".join(messages))
         return 0, True, "dry-run"
     url = "https://api.line.me/v2/bot/message/broadcast"
-    headers = {"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"}
-    payload = {"messages": [{"type": "text", "text": message}]}
-    resp = requests.post(url, headers=headers, json=payload, timeout=15)
+    headers = {"Authorization": f"Bearer {access_token}"}
+    if retry_key:
+        headers["X-Line-Retry-Key"] = retry_key
+    payload = {"messages": [{"type": "text", "text": m} for m in messages]}
+    resp = _line_session().post(url, headers=headers, data=_dumps(payload), timeout=15)
     ok = 200 <= resp.status_code < 300
     return resp.status_code, ok, (resp.text[:500] if resp.text else "")
 
 
-def clip_message(message: str) -> str:
-    if len(message) <= 5000:
-        return message
-    suffix = "…（長文省略）"
-    limit = max(0, 4800 - len(suffix))
-    return message[:limit] + suffix
+# LINE のテキスト上限 5000 文字に余裕を持たせて切る
+_CLIP_SUFFIX = "…（長文省略）"
+_CLIP_LIMIT = 4800 - len(_CLIP_SUFFIX)
 
 
-def send_one(message: str):
-    use_broadcast = os.getenv("USE_BROADCAST", "").strip().lower() in {"1", "true", "yes", "on"}
-    if use_broadcast:
-        status, ok, summary = send_broadcast(message)
-        route = "broadcast"
-        recipient = "broadcast"
-    else:
-        status, ok, summary = send_push(message)
-        route = "push"
-        recipient = os.getenv("LINE_TO") or "(unset)"
-    print(f"LINE送信 route={route} to={recipient} status={status} summary={summary}")
+def clip_message(message: str) -> str:
+    return message if len(message) <= 5000 else message[:_CLIP_LIMIT] + _CLIP_SUFFIX
+
+
+# 送信経路・間隔は実行中に変わらないので import 時に一度だけ決める
+_USE_BROADCAST = get_env_bool("USE_BROADCAST", False)
+_SENDER = send_broadcast if _USE_BROADCAST else send_push
+_ROUTE = "broadcast" if _USE_BROADCAST else "push"
+_SLEEP_S = max(0, _parse_int_env("SLEEP_MS", 250)) / 1000.0
+
+
+# 429（レート制限）と 5xx は間隔を倍にしながら再送する。X-Line-Retry-Key で二重配信を防ぐ
+_RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+_RETRY_MAX = 3
+_RETRY_BACKOFF_S = 0.5
+_RETRY_BACKOFF_MAX_S = 2.0
+
+
+def send_batch(messages: list):
+    """最大 LINE_MAX_MESSAGES 件のメッセージを 1 リクエストで送る"""
+    retry_key = str(uuid.uuid4())
+    delay = _RETRY_BACKOFF_S
+    for attempt in range(_RETRY_MAX + 1):
+        status, ok, summary = _SENDER(messages, retry_key)
+        if attempt and status == 409:
+            # 同じ Retry-Key のリクエストが既に受理済み（前回の応答だけが失われた）
+            status, ok = 200, True
+        if status not in _RETRY_STATUSES or attempt == _RETRY_MAX:
+            break
+        print(f"LINE retry status={status} attempt={attempt + 1} wait={delay:.1f}s")
+        pytime.sleep(delay)
+        delay = min(delay * 2, _RETRY_BACKOFF_MAX_S)
+    route = _ROUTE
+    recipient = "broadcast" if _USE_BROADCAST else (os.getenv("LINE_TO") or "(unset)")
+    print(f"LINE送信 route={route} to={recipient} messages={len(messages)} status={status} summary={summary}")
     if status >= 300:
         print(f"LINE error route={route} to={recipient} status={status} body={summary}", file=sys.stderr)
         sys.exit(1)
     return status, ok, summary
 
 
+def send_one(message: str):
+    return send_batch([message])
+
+
 def send_messages(header: str, messages: list, titles: list = None):
     # Preview
     print("送信前プレビュー: ヘッダー")
@@ -308,36 +677,49 @@ def send_messages(header: str, messages: list, titles: list = None):
         p2 = parts[1] if len(parts) > 1 else ""
         print(f"送信前プレビュー[{i}]: {p1} | {p2}")
 
-    try:
-        sleep_ms = int(os.getenv("SLEEP_MS", "250") or 250)
-    except Exception:
-        sleep_ms = 250
+    concurrency = max(1, _parse_int_env("SEND_CONCURRENCY", 1))
 
     sent = 0
+    requests_made = 0
     errors = 0
 
-    # Header first
-    status, ok, _ = send_one(clip_message(header))
-    sent += 1
-    if not ok:
-        errors += 1
+    # ヘッダー＋各イベント（1件=1吹き出し）を 5 件ずつまとめて送る
+    all_msgs = [header] + list(messages)
+    starts = range(0, len(all_msgs), LINE_MAX_MESSAGES)
+    batches = [[clip_message(m) for m in all_msgs[i:i + LINE_MAX_MESSAGES]] for i in starts]
 
-    pytime.sleep(sleep_ms / 1000.0)
+    if concurrency > 1 and len(batches) > 1:
+        # 先頭（ヘッダー入り）だけ先に送り、残りはリクエストを並行させて RTT を重ねる
+        # 吹き出しの到着順は保証されなくなるので既定は 1（逐次）
+        from concurrent.futures import ThreadPoolExecutor
 
-    # Each event as one message
-    for idx, msg in enumerate(messages):
-        status, ok, summary = send_one(clip_message(msg))
-        sent += 1
+        results = [send_batch(batches[0])]
+        with ThreadPoolExecutor(max_workers=concurrency) as ex:
+            results += list(ex.map(send_batch, batches[1:]))
+    else:
+        results = []
+        for batch in batches:
+            if results:
+                pytime.sleep(_SLEEP_S)
+            results.append(send_batch(batch))
+
+    for start, batch, (status, ok, summary) in zip(starts, batches, results):
+        sent += len(batch)
+        requests_made += 1
         if not ok:
             errors += 1
-            title_hint = titles[idx] if titles and idx < len(titles) else "(no-title)"
+            # all_msgs の先頭はヘッダーなので titles とは 1 つずれる
+            idxs = range(max(start - 1, 0), start - 1 + len(batch))
+            title_hint = ", ".join(titles[i] for i in idxs if titles and i < len(titles)) or "(no-title)"
             print(f"送信失敗: title={title_hint} status={status} summary={summary}")
-        pytime.sleep(sleep_ms / 1000.0)
 
-    print(f"送信完了: sent={sent}, errors={errors}")
+    print(f"送信完了: sent={sent}, requests={requests_made}, errors={errors}")
     return errors == 0
-
-
+
+
+_NEWLINE_TO_SPACE = {0x0A: 0x20}
+
+
 def main():
     parser = argparse.ArgumentParser(description="Send today's TimeTree events to LINE, or send test message.")
     parser.add_argument("--test", dest="test_message", help="テスト送信用の文言（指定時はICSを読まずに送信）")
@@ -348,34 +730,35 @@ def main():
     if args.dump:
         cal = load_calendar(ics_path)
         today = today_jst()
-        day_start, day_end = get_today_range_jst()
-        # Dump all events (max 200)
+        day_start = _jst_midnight(today)
+        day_end = day_start + timedelta(days=1)
+        # Dump all events (max 200)。行はまとめて 1 回で書き出す
         total = 0
         matched = 0
         normalized_count = 0
-        print(f"today_range_jst: {day_start.isoformat()} .. {day_end.isoformat()}")
-        for i, vevent in enumerate(cal.walk("vevent")):
+        rows = [f"today_range_jst: {day_start.isoformat()} .. {day_end.isoformat()}"]
+        for i, vevent in enumerate(calendar_vevents(cal)):
             total += 1
             s, e, allday_like, fixed = normalize_event_to_jst(vevent)
             if s is None or e is None:
                 continue
             if fixed:
                 normalized_count += 1
-            overlaps = overlaps_today_jst(s, e, day_start, day_end)
+            overlaps = s < day_end and e > day_start
             if overlaps:
                 matched += 1
-            summary = str(vevent.get("summary") or "(無題)").replace("\n", " ")
             if i < 200:
-                print(f"{s.isoformat()}, {e.isoformat()}, {bool(allday_like)}, {overlaps}, {summary}")
-        print(f"ゼロ長さ補正した件数: {normalized_count}")
-        print(f"totals: all={total}, matched={matched}")
+                summary = str(vevent.get("summary") or "(無題)").translate(_NEWLINE_TO_SPACE)
+                rows.append(f"{s.isoformat()}, {e.isoformat()}, {bool(allday_like)}, {overlaps}, {summary}")
+        rows.append(f"ゼロ長さ補正した件数: {normalized_count}")
+        rows.append(f"totals: all={total}, matched={matched}")
+        sys.stdout.write("\n".join(rows) + "\n")
         sys.exit(0)
 
     if args.test_message:
         # テストでも整形を使い、1件のダミーイベントとして送信
         today = today_jst()
-        weekdays_jp = ["月", "火", "水", "木", "金", "土", "日"]
-        header = f"【本日の予定 {today.strftime('%Y-%m-%d')}（{weekdays_jp[today.weekday()]}） 全1件】"
+        header = f"【本日の予定 {today.strftime('%Y-%m-%d')}（{_WEEKDAYS_JP[today.weekday()]}） 全1件】"
         when = datetime.now(JST).strftime('%H:%M')
         lines = [f"・{when}", f"{args.test_message}"]
         if get_env_bool("SHOW_MEMO", True):
@@ -384,10 +767,14 @@ def main():
         event_msgs = ["\n".join(lines)]
         ok = send_messages(header, event_msgs, [args.test_message])
     else:
-        cal = load_calendar(ics_path)
         today = today_jst()
-        header, event_msgs = format_events_for_today(cal, today)
-        send_empty = os.getenv("SEND_EMPTY", "false").strip().lower() == "true"
+        # ICS の読み込み・整形と並行して LINE への接続を温めておく（トークン未設定の dry-run では不要）
+        if os.getenv("LINE_CHANNEL_ACCESS_TOKEN") and get_env_bool("PRECONNECT", True):
+            threading.Thread(target=_preconnect_line, daemon=True).start()
+        records, events_total = load_event_records(ics_path, today)
+        header, event_msgs = format_events_for_today(records, today, events_total)
+        # SKIP_IF_EMPTY は SEND_EMPTY より優先（予定の無い日に push 通数を消費しない）
+        send_empty = os.getenv("SEND_EMPTY", "false").strip().lower() == "true" and not get_env_bool("SKIP_IF_EMPTY", False)
         matched = len(event_msgs)
         if matched == 0:
             if send_empty:
@@ -401,8 +788,8 @@ def main():
                 sys.exit(0)
         ok = send_messages(header, event_msgs)
     sys.exit(0 if ok else 1)
-
-
-if __name__ == "__main__":
-    main()
-
+
+
+if __name__ == "__main__":
+    main()
+
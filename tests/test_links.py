@@ -0,0 +1,31 @@
+"""
+リンク抽出の走査範囲（LINK_SCAN_MAX）で URL が途中で切れないかの確認。
+実行: python -m unittest discover -s tests
+"""
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+
+import notify_today as nt  # noqa: E402
+
+
+class LinkScanHeadTest(unittest.TestCase):
+    def test_url_across_limit_is_not_cut(self):
+        url = "https://zoom.us/j/123456789?pwd=abcdef"
+        desc = "x" * 1000 + " " + url + "\n続きのメモ"
+        head = nt.link_scan_head(desc, 1024)
+        self.assertEqual(nt.extract_meeting_link(head), url)
+
+    def test_limit_disabled_or_short(self):
+        self.assertEqual(nt.link_scan_head("a b", 0), "a b")
+        self.assertEqual(nt.link_scan_head("a b", 1024), "a b")
+
+    def test_link_after_limit_is_skipped(self):
+        desc = "x " * 600 + "https://meet.google.com/abc-defg-hij"
+        self.assertEqual(nt.extract_meeting_link(nt.link_scan_head(desc, 1024)), "")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+"""
+ICS の事前間引き（filter_ics_blocks）が、間引かずに全件パースした場合と同じ予定を残すかの確認。
+実行: python -m unittest discover -s tests
+"""
+import sys
+import tempfile
+import unittest
+from datetime import date
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+
+import notify_today as nt  # noqa: E402
+
+TODAY = date(2026, 10, 15)
+
+
+def _ics(*events: str) -> str:
+    body = "".join(f"BEGIN:VEVENT\r\nUID:{i}\r\nSUMMARY:ev{i}\r\n{ev}END:VEVENT\r\n" for i, ev in enumerate(events))
+    return f"BEGIN:VCALENDAR\r\nVERSION:2.0\r\n{body}END:VCALENDAR\r\n"
+
+
+class PrefilterTest(unittest.TestCase):
+    def _titles(self, ics_path: Path, filtered: bool) -> list:
+        if filtered:
+            cal, _ = nt.load_calendar_for_day(ics_path, TODAY)
+        else:
+            cal = nt.load_calendar(ics_path)
+        records = nt.build_event_records(cal)
+        lo = nt.day_start_ts_jst(TODAY)
+        matched, _ = nt.select_today(records, lo, lo + 86400)
+        return sorted(rec[4] for _, rec in matched)
+
+    def assertSameAsFullParse(self, *events: str, expected: int) -> None:
+        with tempfile.TemporaryDirectory() as d:
+            path = Path(d) / "t.ics"
+            path.write_text(_ics(*events), encoding="utf-8", newline="")
+            full = self._titles(path, filtered=False)
+            self.assertEqual(len(full), expected)
+            self.assertEqual(self._titles(path, filtered=True), full)
+
+    def test_zero_length_yesterday_evening(self):
+        # 同時刻の DTEND は +1時間に補正され、今日 0:00 を跨ぐ
+        self.assertSameAsFullParse(
+            "DTSTART;TZID=Asia/Tokyo:20261014T233000\r\nDTEND;TZID=Asia/Tokyo:20261014T233000\r\n",
+            "DTSTART:20261014T233000\r\nDTEND:20261014T233000\r\n",
+            "DTSTART:20261014T143000Z\r\nDTEND:20261014T143000Z\r\n",
+            expected=3,
+        )
+
+    def test_reversed_same_day_yesterday_evening(self):
+        self.assertSameAsFullParse(
+            "DTSTART:20261014T233000\r\nDTEND:20261014T100000\r\n",
+            "DTSTART;TZID=Asia/Tokyo:20261014T231500\r\nDTEND;TZID=Asia/Tokyo:20261014T080000\r\n",
+            expected=2,
+        )
+
+    def test_reversed_mixed_zone_two_days_ago(self):
+        # UTC 10/13 16:40 = JST 10/14 01:40。DATE の DTEND が前なので終日扱いで +1日 → 今日に掛かる
+        self.assertSameAsFullParse(
+            "DTSTART:20261013T164000Z\r\nDTEND;VALUE=DATE:20261013\r\n",
+            "DTSTART:20261013T200000Z\r\nDTEND;VALUE=DATE:20261014\r\n",
+            expected=2,
+        )
+
+    def test_missing_dtend_yesterday_evening(self):
+        self.assertSameAsFullParse("DTSTART:20261014T233000\r\n", expected=1)
+
+    def test_not_today(self):
+        self.assertSameAsFullParse(
+            "DTSTART:20261014T213000\r\nDTEND:20261014T213000\r\n",
+            "DTSTART:20261015T233000\r\nDTEND:20261016T003000\r\n",
+            "DTSTART:20261016T000000\r\nDTEND:20261016T000000\r\n",
+            expected=1,
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,45 +3,35 @@
 List cron schedules in GitHub Actions workflows.
 
 Outputs file path, workflow name, and cron lines for each *.yml under .github/workflows.
-No external dependencies; parses name: and cron: lines heuristically.
+No external dependencies; parses name: and cron: lines heuristically with two regexes per file.
 """
 from __future__ import annotations
 
+import re
 import sys
 from pathlib import Path
 
+# Run once over the whole file instead of per-line strip/split/startswith checks
+_NAME_RE = re.compile(r"^[^\S\n]*name:(.*)$", re.M)
+_CRON_RE = re.compile(r"^[^\S\n]*(?:- )?cron:([^#\n]*)", re.M)
 
-def extract_workflow_name(lines: list[str]) -> str | None:
-    for line in lines:
-        # strip comments and trailing newline
-        raw = line.rstrip("\n")
-        if raw.strip().startswith("#"):
-            continue
-        if raw.lstrip().startswith("name:"):
-            # Keep original after colon
-            try:
-                return raw.split(":", 1)[1].strip().strip('"')
-            except Exception:
-                return raw.strip()
-    return None
 
+def extract_workflow_name(text: str) -> str | None:
+    # First "name:" line (comment lines never match); keep original after colon
+    m = _NAME_RE.search(text)
+    return m.group(1).strip().strip('"') if m else None
 
-def extract_crons(lines: list[str]) -> list[str]:
+
+def extract_crons(text: str) -> list[str]:
     crons: list[str] = []
-    for raw in lines:
-        # Remove inline comments conservatively
-        line_no_comment = raw.split('#', 1)[0]
-        line = line_no_comment.strip()
-        if line.startswith("#"):
-            continue
-        if line.startswith("- cron:") or line.startswith("cron:"):
-            # Accept both top-level and list-item style
-            expr = line.split(":", 1)[1].strip()
-            # Trim surrounding quotes if present
-            if (expr.startswith('"') and expr.endswith('"')) or (expr.startswith("'") and expr.endswith("'")):
-                expr = expr[1:-1]
-            if expr:
-                crons.append(expr)
+    # Accept both top-level and list-item style; inline comments are cut by the pattern
+    for m in _CRON_RE.finditer(text):
+        expr = m.group(1).strip()
+        # Trim surrounding quotes if present
+        if (expr.startswith('"') and expr.endswith('"')) or (expr.startswith("'") and expr.endswith("'")):
+            expr = expr[1:-1]
+        if expr:
+            crons.append(expr)
     return crons
 
 
@@ -60,7 +50,7 @@ def main() -> int:
     print("# GitHub Actions Cron Audit")
     print()
     for path in files:
-        text = path.read_text(encoding="utf-8", errors="ignore").splitlines()
+        text = path.read_text(encoding="utf-8", errors="ignore")
         name = extract_workflow_name(text) or "(no name)"
         crons = extract_crons(text)
         print(f"- file: {path}")